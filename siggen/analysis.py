@@ -0,0 +1,244 @@
+'''Streaming analysis of synth signals.
+
+The audio thread only copies samples into a ring buffer (a PYO
+`TableFill` writing into a `DataTable`).  An Analyzer runs on a
+supervisor worker thread, and at most `rate` times a second takes the
+most recent `size` samples from the ring buffer and computes:
+
+- `rms` and `peak` levels
+- `spectrum`, the magnitude spectrum of the Hann-windowed frame
+- `freq`, the fundamental frequency estimated from the autocorrelation
+  of the frame (or None if the signal is too quiet)
+
+The frame, window, spectrum and autocorrelation buffers are allocated
+once, when the Analyzer is created.  `numpy.fft` cannot write into an
+existing array, so the output of each FFT is a new array (one per
+transform, and two transforms per frame).
+'''
+
+from __future__ import division
+
+import logging
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import pyo
+
+DEFAULT_SIZE = 2048
+DEFAULT_OVERLAP = 2
+DEFAULT_RATE = 10
+DEFAULT_FMIN = 50
+DEFAULT_FMAX = 2000
+DEFAULT_THRESHOLD = 0.01
+
+
+class Analyzer(object):
+    def __init__(self, name, sr,
+                 size=DEFAULT_SIZE,
+                 overlap=DEFAULT_OVERLAP,
+                 rate=DEFAULT_RATE,
+                 fmin=DEFAULT_FMIN,
+                 fmax=DEFAULT_FMAX,
+                 threshold=DEFAULT_THRESHOLD):
+
+        self.init_log()
+
+        self.name = name
+        self.sr = sr
+        self.size = size
+        self.threshold = threshold
+
+        # Analyze no more often than once per hop, and no more often
+        # than `rate` times per second.
+        hop = size // overlap
+        self.interval = max(hop / sr, 1 / rate)
+
+        # The lag range extends one sample beyond fmin so that peaks at
+        # the end of the range can be interpolated.  A frame must hold
+        # at least two periods of the lowest frequency for its
+        # autocorrelation to show the period.
+        self.fmin = fmin
+        self.fmax = fmax
+        self.maxlag = min(size // 2, int(sr / fmin) + 1)
+
+        self.window = numpy.hanning(size).astype(numpy.float32)
+        self.offsets = numpy.arange(size)
+        self.index = numpy.empty(size, dtype=self.offsets.dtype)
+        self.frame = numpy.zeros(size, dtype=numpy.float32)
+        self.windowed = numpy.zeros(size, dtype=numpy.float32)
+        self.padded = numpy.zeros(2 * size, dtype=numpy.float32)
+        self.spectrum = numpy.zeros(size // 2 + 1)
+        self.power = numpy.zeros(size + 1)
+        self.overlap = size - numpy.arange(self.maxlag + 2)
+        self.acf = numpy.zeros(self.maxlag + 2)
+
+        self.table = None
+        self.fill = None
+        self.ring = None
+        self.latest = None
+        self._listeners = []
+        self._lock = threading.Lock()
+
+        self.log.debug('analyzer %s: size = %d, interval = %f',
+                       name, size, self.interval)
+
+    def init_log(self):
+        self.log = logging.getLogger('%s.%s' % (
+            __name__, self.__class__.__name__))
+
+    def attach(self, source):
+        '''Start copying the output of PYO object _source_ into the
+        ring buffer.  The ring buffer holds two analysis frames so that
+        the audio thread never overwrites the frame being read.  May
+        be called again (for example after a server restart) while the
+        analyzer is running.'''
+        with self._lock:
+            self.table = pyo.DataTable(size=2 * self.size)
+            self.fill = pyo.TableFill(source, self.table)
+            self.ring = numpy.asarray(self.table.getBuffer())
+
+    def detach(self):
+        '''Release the PYO objects created by `attach`.  The view of the
+        table buffer must be released before the table itself.'''
+        with self._lock:
+            self.ring = None
+            self.fill = None
+            self.table = None
+
+    def subscribe(self, func):
+        '''Call _func_ with each new analysis result.  Listeners are
+        called on the analysis thread, while the analyzer is
+        attached.'''
+        with self._lock:
+            self._listeners.append(func)
+
+    def unsubscribe_all(self):
+        with self._lock:
+            self._listeners = []
+
+    def read_frame(self):
+        '''Copy the most recent `size` samples from the ring buffer into
+        `self.frame`.'''
+        end = self.fill.getCurrentPos()
+        numpy.add(self.offsets, end - self.size, out=self.index)
+        numpy.take(self.ring, self.index, mode='wrap', out=self.frame)
+
+    def estimate_freq(self, rms):
+        '''Estimate the fundamental frequency of `self.frame` from its
+        autocorrelation (computed as the inverse FFT of the power
+        spectrum of the zero-padded frame).  Returns None if the frame
+        is too quiet or has no fundamental between `fmin` and
+        `fmax`.'''
+        if rms < self.threshold:
+            return None
+
+        numpy.subtract(self.frame, self.frame.mean(),
+                       out=self.padded[:self.size])
+        numpy.abs(numpy.fft.rfft(self.padded), out=self.power)
+        numpy.square(self.power, out=self.power)
+
+        # Divide each lag by the number of samples it overlaps, so that
+        # the peaks of a periodic signal do not shrink with the lag.
+        acf = self.acf
+        numpy.divide(numpy.fft.irfft(self.power)[:self.maxlag + 2],
+                     self.overlap, out=acf)
+
+        # Skip the peak around lag 0: the search starts at the first
+        # zero crossing of the autocorrelation.  Peaks above fmax are
+        # found and rejected below, rather than mistaking one of their
+        # multiples for the fundamental.
+        negative = numpy.flatnonzero(acf[:self.maxlag + 1] < 0)
+        if not len(negative):
+            return None
+        start = int(negative[0])
+
+        # Signals without a clear period (such as noise) have no peak
+        # close to the lag 0 value.
+        search = acf[start:self.maxlag + 1]
+        best = search.max()
+        if best < 0.5 * acf[0]:
+            return None
+
+        # The peaks at multiples of the period are about as high as the
+        # peak at the period itself, so take the first peak close to
+        # the highest one.
+        i = int(numpy.flatnonzero(search >= 0.9 * best)[0])
+        while i + 1 < len(search) and search[i + 1] > search[i]:
+            i += 1
+        lag = start + i
+
+        # refine the peak with parabolic interpolation, unless it is at
+        # the edge of the search range.
+        shift = 0
+        if start < lag < self.maxlag:
+            a, b, c = acf[lag - 1], acf[lag], acf[lag + 1]
+            denom = a - 2 * b + c
+            if denom:
+                shift = 0.5 * (a - c) / denom
+
+        # PYO only accepts Python numbers, not numpy scalars
+        freq = float(self.sr / (lag + shift))
+        if not self.fmin <= freq <= self.fmax:
+            return None
+
+        return freq
+
+    def analyze(self):
+        '''Analyze the most recent frame.  Returns None if the analyzer
+        is not attached to a source.'''
+        with self._lock:
+            if self.fill is None:
+                return None
+            self.read_frame()
+
+        # self.windowed is free to use as scratch space until the
+        # window is applied.
+        numpy.abs(self.frame, out=self.windowed)
+        peak = float(self.windowed.max())
+        numpy.square(self.windowed, out=self.windowed)
+        rms = float(numpy.sqrt(self.windowed.mean()))
+
+        numpy.multiply(self.frame, self.window, out=self.windowed)
+        numpy.abs(numpy.fft.rfft(self.windowed), out=self.spectrum)
+
+        return {
+            'rms': rms,
+            'peak': peak,
+            'freq': self.estimate_freq(rms),
+            'spectrum': self.spectrum,
+        }
+
+    def publish(self, result):
+        '''Call the listeners with _result_.  Listeners usually set
+        PYO objects in the graph the analyzer is attached to, so they
+        are called with the analyzer lock held: `detach` (which is
+        called before that graph is released) waits for them to
+        finish, and they are not called once the analyzer has been
+        detached.'''
+        with self._lock:
+            self.latest = result
+            if self.fill is None:
+                return
+
+            for func in self._listeners:
+                try:
+                    func(result)
+                except Exception:
+                    self.log.exception('analysis listener failed')
+
+    def run(self, stop):
+        '''Analyze and publish results until _stop_ is set.  Intended to
+        be run with `Supervisor.start_worker`.'''
+        while not stop.wait(self.interval):
+            result = self.analyze()
+            if result is None:
+                continue
+
+            self.log.debug('%s: rms = %f, peak = %f, freq = %s',
+                           self.name, result['rms'], result['peak'],
+                           result['freq'])
+            self.publish(result)
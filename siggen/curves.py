@@ -0,0 +1,172 @@
+'''Control curves map MIDI control values to parameter values.
+
+Each curve is computed once into a lookup table with one entry per
+possible control value: 128 entries for ordinary (7-bit) controls, or
+16384 entries for 14-bit controls (which combine a control, the most
+significant 7 bits, with the control 32 numbers above it, the least
+significant 7 bits).  Curves are cached, so controls with the same
+curve share a table.
+
+A curve is described by a dictionary with the following keys:
+
+- `curve` -- one of:
+  - `linear` -- from `min` to `max`
+  - `exp` -- exponential from `min` to `max` (both must be positive)
+  - `db` -- linear in decibels from `min` to `max` (default -60 to
+    0), converted to an amplitude; the lowest control value is
+    silence
+  - `key` -- the frequency of the corresponding key on an 88 key piano
+  - `note` -- the frequency of the corresponding MIDI note number
+  - `points` -- linear interpolation between `points`, a list of
+    `[x, y]` pairs with `x` between 0 and 1
+- `min`, `max` -- the range of the curve
+- `bits` -- 7 (the default) or 14
+'''
+
+from __future__ import division
+
+import bisect
+import logging
+
+from .exc import InvalidCurve
+
+FREQ_A4 = 440
+LOG = logging.getLogger(__name__)
+
+_cache = {}
+
+
+def curve_linear(x, minval=0, maxval=1):
+    return minval + (maxval - minval) * x
+
+
+def curve_exp(x, minval=20, maxval=20000):
+    if minval <= 0 or maxval <= 0:
+        raise InvalidCurve('exp curve range must be positive')
+    return minval * (maxval / minval) ** x
+
+
+def curve_db(x, minval=-60, maxval=0):
+    if x == 0:
+        return 0
+    return 10 ** ((minval + (maxval - minval) * x) / 20)
+
+
+def curve_key(x, minval=None, maxval=None):
+    key = int(x * 88)
+    return 2 ** ((key - 49) / 12) * FREQ_A4
+
+
+def curve_note(x, minval=None, maxval=None):
+    return 2 ** ((x * 127 - 69) / 12) * FREQ_A4
+
+
+CURVES = {
+    'linear': curve_linear,
+    'exp': curve_exp,
+    'db': curve_db,
+    'key': curve_key,
+    'note': curve_note,
+}
+
+
+def curve_points(points):
+    '''Return a function that interpolates linearly between _points_.'''
+    points = sorted(points)
+    xs = [p[0] for p in points]
+
+    def curve(x, minval=None, maxval=None):
+        i = bisect.bisect_right(xs, x)
+        if i == 0:
+            return points[0][1]
+        if i == len(points):
+            return points[-1][1]
+
+        (x0, y0), (x1, y1) = points[i - 1], points[i]
+        return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+    return curve
+
+
+class Curve(object):
+    '''A precomputed lookup table for a control curve.  Call the curve
+    with a control value to look up the corresponding parameter
+    value.'''
+
+    def __init__(self, kind='linear', minval=None, maxval=None,
+                 points=None, bits=7):
+
+        if bits not in (7, 14):
+            raise InvalidCurve('bits must be 7 or 14')
+
+        if kind == 'points':
+            if not points or len(points) < 2:
+                raise InvalidCurve('points curve needs at least 2 points')
+            func = curve_points(points)
+        else:
+            try:
+                func = CURVES[kind]
+            except KeyError:
+                raise InvalidCurve('unknown curve: %s' % kind)
+
+        kwargs = {}
+        if minval is not None:
+            kwargs['minval'] = minval
+        if maxval is not None:
+            kwargs['maxval'] = maxval
+
+        self.kind = kind
+        self.bits = bits
+        self.size = 2 ** bits
+        self.table = [func(i / (self.size - 1), **kwargs)
+                      for i in range(self.size)]
+
+        LOG.debug('computed %s curve (%d entries): %s - %s',
+                  kind, self.size, self.table[0], self.table[-1])
+
+    def __call__(self, value):
+        return self.table[value]
+
+    def nearest(self, x):
+        '''Return the control value whose curve value is closest to
+        _x_.'''
+        return min(range(self.size), key=lambda i: abs(self.table[i] - x))
+
+
+def curve_key_for(spec):
+    return (spec.get('curve', 'linear'),
+            spec.get('min'),
+            spec.get('max'),
+            tuple(tuple(p) for p in spec.get('points', [])),
+            spec.get('bits', 7))
+
+
+def get_curve(spec):
+    '''Return the (shared) Curve described by dictionary _spec_.'''
+    key = curve_key_for(spec)
+    if key not in _cache:
+        kind, minval, maxval, points, bits = key
+        _cache[key] = Curve(kind, minval, maxval, points, bits)
+
+    return _cache[key]
+
+
+def parse_mapping(mapping, defaults=None):
+    '''Parse a control mapping from the configuration.  A mapping is
+    either a MIDI control number, or a dictionary with a `control` key
+    and the curve keys described above.  Returns a (control, spec)
+    tuple, where missing curve keys are taken from _defaults_.'''
+    spec = dict(defaults or {})
+
+    if isinstance(mapping, dict):
+        spec.update(mapping)
+        control = spec.pop('control')
+    else:
+        control = mapping
+
+    return control, spec
+
+
+def combine(msb, lsb):
+    '''Combine the two halves of a 14-bit control value.'''
+    return (msb << 7) | lsb
@@ -7,6 +7,28 @@ class UnknownSynthType(SynthError):
     recognized 'type' key.'''
     pass
 
+class InvalidOutputChannel(SynthError):
+    '''Raised if a synth is routed to an output channel that does not
+    exist on the output device.'''
+    pass
+
+
+class UnknownAnalysisParameter(SynthError):
+    '''Raised if an analyzer is asked to drive a synth parameter other
+    than `freq` or `volume`.'''
+    pass
+
+
+class InvalidSequence(SynthError):
+    '''Raised if the sequencer configuration cannot be compiled.'''
+    pass
+
+
+class InvalidCurve(SynthError):
+    '''Raised if a control curve in the configuration is invalid.'''
+    pass
+
+
 class BootFailed(SynthError):
     '''This exception is raised if the PYO sound server fails to start.'''
     pass
@@ -2,18 +2,20 @@
 
 import argparse
 import logging
-import time
 import yaml
 import signal
+import sys
 from functools import partial
 
 from . import utils
 from . import mute_alsa  # NOQA
+from . import supervisor
 from . import synth
+from . import tune
+from . import watchdog
 
 
 LOG = logging.getLogger()
-QUIT = False
 
 
 def parse_args():
@@ -31,6 +33,13 @@ def parse_args():
     p.add_argument('--config', '-f',
                    default='siggen.yml')
 
+    p.add_argument('command',
+                   nargs='?',
+                   choices=['run', 'tune'],
+                   default='run',
+                   help='run the synthesizer (default) or tune the '
+                   'wave table settings for this host')
+
     p.add_argument('--nomidi',
                    action='store_true',
                    help=argparse.SUPPRESS)
@@ -39,45 +48,22 @@ def parse_args():
                    action='store_true',
                    help='list available devices')
 
+    g = p.add_argument_group('Tuning options')
+    g.add_argument('--duration',
+                   type=float,
+                   default=tune.DEFAULT_DURATION,
+                   help='seconds of audio to render for each measurement')
+
     p.set_defaults(loglevel='WARN')
     return p.parse_args()
 
 
-def set_quit_flag(*args):
-    global QUIT
-
-    LOG.debug('setting global quit flag')
-    QUIT = True
-
-
-def main():
-    args = parse_args()
-    logging.basicConfig(
-        level=args.loglevel)
-
-    if args.list:
-        pa_inputs, pa_outputs = synth.discover_pa_devices()
-        pm_inputs = synth.discover_pm_devices()
-
-        print 'Audio inputs:'
-        for i, dev in pa_inputs.items():
-            print '[%4d] %s' % (i, dev['name'])
-
-        print
-        print 'Audio outputs:'
-        for i, dev in pa_outputs.items():
-            print '[%4d] %s' % (i, dev['name'])
-
-        print
-        print 'MIDI inputs:'
-        for i, dev in pm_inputs.items():
-            print '[%4d] %s' % (i, dev)
-
-        return
+def load_config(path):
+    with open(path) as fd:
+        return yaml.load(fd)
 
-    with open(args.config) as fd:
-        config = yaml.load(fd)
 
+def create_synth(config, args, dispatch=None):
     kwargs = {}
     inputDevice = config.get('devices', {}).get('input')
     outputDevice = config.get('devices', {}).get('output')
@@ -101,6 +87,8 @@ def main():
         controls=config.get('controls'),
         mixers=config.get('mixers'),
         synths=config.get('synths'),
+        sequence=config.get('sequencer'),
+        dispatch=dispatch,
         **kwargs)
 
     if 'external' in config:
@@ -110,13 +98,138 @@ def main():
                                      partial(utils.run_script,
                                              action['script']))
 
-    signal.signal(signal.SIGINT, set_quit_flag)
+    return s
+
+
+class Runtime(object):
+    '''Owns the synthesizer and the supervisor event loop.  SIGINT and
+    SIGTERM stop the event loop; SIGHUP re-reads the configuration file
+    and rebuilds the synthesizer.'''
+
+    def __init__(self, args):
+        self.args = args
+        self.synth = None
+        self.config = None
+        self.workers = []
+        self.supervisor = supervisor.Supervisor()
+
+    def start_synth(self, config):
+        self.synth = create_synth(config, self.args,
+                                  dispatch=self.supervisor.submit)
+        self.config = config
+
+        for analyzer in self.synth.analyzers:
+            self.workers.append(self.supervisor.start_worker(
+                'analysis-%s' % analyzer.name, analyzer.run))
+
+        options = config.get('watchdog', {})
+        if options is not False:
+            options = options if isinstance(options, dict) else {}
+            # if the watchdog cannot restart the server, exit so that
+            # the service manager restarts siggen.
+            w = watchdog.Watchdog(self.synth,
+                                  on_failure=self.supervisor.stop,
+                                  **options)
+            self.workers.append(self.supervisor.start_worker(
+                'watchdog', w.run))
+
+    def stop_synth(self):
+        # workers may be reading PYO tables, so stop them (the watchdog
+        # first) before the server is shut down.
+        for worker in reversed(self.workers):
+            self.supervisor.stop_worker(worker)
+        self.workers = []
+
+        if self.synth is not None:
+            self.synth.shutdown()
+            self.synth = None
+
+    def reload(self):
+        LOG.warn('reloading configuration from %s', self.args.config)
+        try:
+            config = load_config(self.args.config)
+        except (IOError, yaml.YAMLError) as err:
+            LOG.error('failed to reload configuration: %s', err)
+            return
+
+        # Only one PYO server can exist at a time, so the new synth
+        # cannot be built until the old one is gone.  If the new
+        # configuration does not work, go back to the previous one, and
+        # if that fails too, exit so that the service manager can
+        # restart siggen.
+        previous = self.config
+        self.stop_synth()
+
+        try:
+            self.start_synth(config)
+        except Exception:
+            LOG.exception('failed to start synth with new configuration')
+        else:
+            LOG.warn('siggen reloaded')
+            return
+
+        self.stop_synth()
+        try:
+            self.start_synth(previous)
+        except Exception:
+            LOG.exception('failed to restore previous configuration')
+            self.stop_synth()
+            self.supervisor.stop()
+        else:
+            LOG.warn('restored previous configuration')
+
+    def run(self):
+        self.start_synth(load_config(self.args.config))
+
+        self.supervisor.add_signal_handler(signal.SIGINT,
+                                           self.supervisor.stop)
+        self.supervisor.add_signal_handler(signal.SIGTERM,
+                                           self.supervisor.stop)
+        self.supervisor.add_signal_handler(signal.SIGHUP, self.reload)
+
+        LOG.warn('siggen ready')
+        try:
+            self.supervisor.run()
+        finally:
+            self.stop_synth()
+            self.supervisor.close()
 
-    LOG.warn('siggen ready')
-    while not QUIT:
-        time.sleep(0.5)
 
-    s.shutdown()
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=args.loglevel)
+
+    if args.list:
+        pa_inputs, pa_outputs = synth.discover_pa_devices()
+        pm_inputs = synth.discover_pm_devices()
+
+        print 'Audio inputs:'
+        for i, dev in pa_inputs.items():
+            print '[%4d] %s' % (i, dev['name'])
+
+        print
+        print 'Audio outputs:'
+        for i, dev in pa_outputs.items():
+            print '[%4d] %s' % (i, dev['name'])
+
+        print
+        print 'MIDI inputs:'
+        for i, dev in pm_inputs.items():
+            print '[%4d] %s' % (i, dev)
+
+        return
+
+    if args.command == 'tune':
+        if tune.numpy is None:
+            LOG.error('siggen tune requires numpy')
+            sys.exit(1)
+
+        path = tune.main(duration=args.duration)
+        print 'Wrote host profile to %s' % path
+        return
+
+    Runtime(args).run()
     LOG.warn('all done.')
 
 if __name__ == '__main__':
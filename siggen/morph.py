@@ -0,0 +1,82 @@
+'''A wavetable oscillator that morphs between waveforms.
+
+The waveforms are precomputed, normalized, and stored one after the
+other ("frames") in a single `DataTable`.  A single `Phasor` provides
+the oscillator phase; two `Pointer` objects read the same phase from
+two adjacent frames, and `Interp` crossfades between them according to
+the fractional part of the morph position.
+'''
+
+from __future__ import division
+
+import pyo
+
+
+def create_frame_stack(tables):
+    '''Concatenate the contents of PYO _tables_ (which must all be the
+    same size) into a single DataTable, normalizing each frame.'''
+    samples = []
+    for t in tables:
+        t.normalize()
+        samples.extend(t.getTable())
+
+    return pyo.DataTable(size=len(samples), init=samples)
+
+
+class MorphOsc(pyo.PyoObject):
+    '''Play one of the _frames_ frames in _table_ at frequency _freq_.
+    _morph_ is the frame position (between 0 and frames - 1); values
+    between two frames crossfade between them.'''
+
+    def __init__(self, table, frames, freq=1000, morph=0, mul=1, add=0):
+        pyo.PyoObject.__init__(self, mul, add)
+
+        self._table = table
+        self._frames = frames
+        self._freq = freq
+        self._morph = morph
+
+        self._phase = pyo.Phasor(freq=freq)
+        self._position = pyo.Sig(morph)
+
+        # The last frame is reached with frac == 1 rather than by
+        # reading past the end of the table.
+        self._base = pyo.Min(pyo.Floor(self._position), comp=frames - 2)
+        self._frac = self._position - self._base
+
+        self._a = pyo.Pointer(table, (self._base + self._phase) / frames)
+        self._b = pyo.Pointer(table,
+                              (self._base + 1 + self._phase) / frames)
+        self._out = pyo.Interp(self._a, self._b, interp=self._frac,
+                               mul=mul, add=add)
+        self._base_objs = self._out.getBaseObjects()
+
+    @property
+    def frames(self):
+        return self._frames
+
+    @property
+    def freq(self):
+        return self._freq
+
+    @property
+    def morph(self):
+        return self._morph
+
+    def setFreq(self, x):
+        self._freq = x
+        self._phase.freq = x
+
+    def setMorph(self, x):
+        self._morph = x
+        self._position.value = x
+
+    def play(self, dur=0, delay=0):
+        for obj in (self._phase, self._position, self._a, self._b):
+            obj.play(dur, delay)
+        return pyo.PyoObject.play(self, dur, delay)
+
+    def stop(self, *args):
+        for obj in (self._phase, self._position, self._a, self._b):
+            obj.stop(*args)
+        return pyo.PyoObject.stop(self, *args)
@@ -0,0 +1,56 @@
+'''Host profiles record settings that depend on the machine siggen is
+running on, such as the wave table parameters selected by `siggen
+tune`.  Profiles are cached as YAML files in the user's cache
+directory, one per host.'''
+
+import logging
+import os
+import socket
+import yaml
+
+LOG = logging.getLogger(__name__)
+
+
+def profile_path(hostname=None):
+    '''Return the path of the profile for _hostname_ (by default, the
+    current host).'''
+    if hostname is None:
+        hostname = socket.gethostname()
+
+    cachedir = os.environ.get('XDG_CACHE_HOME',
+                              os.path.expanduser('~/.cache'))
+    return os.path.join(cachedir, 'siggen', 'host-%s.yml' % hostname)
+
+
+def load_host_profile(path=None):
+    '''Load the host profile.  Returns an empty profile if there is no
+    cached profile for this host.'''
+    if path is None:
+        path = profile_path()
+
+    try:
+        with open(path) as fd:
+            profile = yaml.safe_load(fd)
+    except IOError:
+        LOG.debug('no host profile at %s', path)
+        return {}
+
+    LOG.info('loaded host profile from %s', path)
+    return profile or {}
+
+
+def save_host_profile(profile, path=None):
+    '''Write _profile_ to the host profile cache.  Returns the path of
+    the profile.'''
+    if path is None:
+        path = profile_path()
+
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    with open(path, 'w') as fd:
+        yaml.safe_dump(profile, fd, default_flow_style=False)
+
+    LOG.info('saved host profile to %s', path)
+    return path
@@ -0,0 +1,243 @@
+'''A step sequencer that runs inside the PYO audio engine.
+
+The `sequencer` configuration section is compiled into PYO objects
+when the synths are created:
+
+- the tempo is a `Sig` (or a control signal, if the tempo is attached
+  to a MIDI control), so tempo changes never require the patterns to
+  be rebuilt;
+- a single `Metro` clocked from the tempo ticks at the finest
+  subdivision used by any pattern, and drives one `Iter` per pattern
+  stepping through the precomputed pattern values (repeated as needed
+  for patterns with coarser steps), so all patterns stay in phase;
+- timed play/stop events are compiled into a per-synth gate pattern
+  (one step per tick) that is multiplied into the synth volume.
+
+Every step therefore happens on an exact sample, with no Python code
+running on the audio path.
+'''
+
+from __future__ import division
+
+import logging
+
+import pyo
+
+from .exc import InvalidSequence
+
+DEFAULT_TEMPO = 120
+DEFAULT_TEMPO_RANGE = [40, 240]
+DEFAULT_DIVISION = 4
+DEFAULT_RESOLUTION = 4
+LOG = logging.getLogger(__name__)
+
+
+def midi_to_hz(note):
+    return 440 * 2 ** ((note - 69) / 12)
+
+
+def expand_arpeggio(arpeggio):
+    '''Expand an `arpeggio` description into a list of MIDI note
+    numbers.'''
+    root = arpeggio.get('root', 60)
+    chord = arpeggio.get('chord', [0, 4, 7])
+    octaves = arpeggio.get('octaves', 1)
+    mode = arpeggio.get('mode', 'up')
+
+    notes = [root + 12 * octave + interval
+             for octave in range(octaves)
+             for interval in chord]
+
+    if mode == 'up':
+        return notes
+    elif mode == 'down':
+        return list(reversed(notes))
+    elif mode == 'updown':
+        return notes + list(reversed(notes))[1:-1]
+
+    raise InvalidSequence('unknown arpeggio mode: %s' % mode)
+
+
+def lcm(a, b):
+    x, y = a, b
+    while y:
+        x, y = y, x % y
+    return a * b // x
+
+
+def stretch(values, repeat):
+    '''Repeat each element of _values_ _repeat_ times.'''
+    return [v for v in values for _ in range(repeat)]
+
+
+def compile_gate(events, length):
+    '''Given a list of (tick, state) tuples, return a list of _length_
+    gate values (1 for playing, 0 for stopped).  The sequence loops, so
+    ticks before the first event take the state of the last event.'''
+    events = sorted(events)
+    state = events[-1][1]
+    gate = []
+
+    pending = list(events)
+    for tick in range(length):
+        while pending and pending[0][0] <= tick:
+            state = pending.pop(0)[1]
+        gate.append(1.0 if state else 0.0)
+
+    return gate
+
+
+class Sequencer(object):
+    def __init__(self, config, synths, synth_configs, control):
+        self.init_log()
+
+        self.config = config
+        self.synths = synths
+        self.synth_configs = synth_configs
+        self.control = control
+
+        self._iters = []
+        self._levels = {}
+
+        self.compile()
+
+    def init_log(self):
+        self.log = logging.getLogger('%s.%s' % (
+            __name__, self.__class__.__name__))
+
+    def compile_tempo(self):
+        tempo = self.config.get('tempo', DEFAULT_TEMPO)
+
+        if 'tempo_control' in self.config:
+            minbpm, maxbpm = self.config.get('tempo_range',
+                                             DEFAULT_TEMPO_RANGE)
+            self.log.debug('tempo from control %s (%d - %d bpm)',
+                           self.config['tempo_control'], minbpm, maxbpm)
+            self.bpm = self.control(
+                self.config['tempo_control'],
+                {'curve': 'linear', 'min': minbpm, 'max': maxbpm},
+                init=tempo)
+        else:
+            self.log.debug('tempo fixed at %f bpm', tempo)
+            self.bpm = pyo.Sig(tempo)
+
+    def compile_clock(self):
+        '''Create the master clock, which ticks often enough to play
+        every pattern's steps.'''
+        divisions = [pattern.get('division', DEFAULT_DIVISION)
+                     for pattern in self.config.get('patterns', [])]
+        if self.config.get('events'):
+            divisions.append(self.resolution)
+
+        self.ticks = 1
+        for division in divisions:
+            self.ticks = lcm(self.ticks, division)
+
+        self.log.debug('clock ticks %d times per beat', self.ticks)
+        self.clock = pyo.Metro(time=pyo.Sig(60 / self.ticks) / self.bpm)
+
+    def create_iter(self, values, division):
+        '''Create an Iter that steps through _values_, _division_ steps
+        per beat.'''
+        values = stretch([float(v) for v in values],
+                         self.ticks // division)
+        it = pyo.Iter(self.clock, choice=values, init=values[0])
+        self._iters.append(it)
+        return it
+
+    def level(self, index):
+        '''Return the current volume of synth _index_ as seen by the
+        sequencer: the synth's volume control if it has one, or
+        1.'''
+        if index not in self._levels:
+            if 'volume' in self.synth_configs[index]:
+                self._levels[index] = self.synths[index].mul
+            else:
+                self._levels[index] = 1
+
+        return self._levels[index]
+
+    def scale_level(self, index, sig):
+        self._levels[index] = sig * self.level(index)
+        self.synths[index].setMul(self._levels[index])
+
+    def compile_pattern(self, pattern):
+        index = pattern['synth']
+        param = pattern.get('param', 'freq')
+
+        if 'arpeggio' in pattern:
+            steps = expand_arpeggio(pattern['arpeggio'])
+        else:
+            steps = pattern.get('steps')
+
+        if not steps:
+            raise InvalidSequence('pattern for synth %d has no steps' %
+                                  index)
+
+        division = pattern.get('division', DEFAULT_DIVISION)
+        self.log.debug('synth %d %s pattern: %s', index, param, steps)
+
+        if param == 'freq':
+            it = self.create_iter([midi_to_hz(n) for n in steps], division)
+            self.synths[index].setFreq(it)
+        elif param == 'volume':
+            it = self.create_iter(steps, division)
+            self.scale_level(index, it)
+        else:
+            raise InvalidSequence('unknown pattern parameter: %s' % param)
+
+    def compile_events(self, events):
+        resolution = self.resolution
+        length = self.config.get(
+            'length', max(e['beat'] for e in events) + 1)
+        length = int(length * resolution)
+
+        gates = {}
+        for event in events:
+            if event['action'] not in ('play', 'stop'):
+                raise InvalidSequence('unknown event action: %s' %
+                                      event['action'])
+
+            tick = int(event['beat'] * resolution)
+            if tick >= length:
+                raise InvalidSequence('event at beat %s is past the end '
+                                      'of the sequence' % event['beat'])
+
+            gates.setdefault(event['synth'], []).append(
+                (tick, event['action'] == 'play'))
+
+        for index, synth_events in gates.items():
+            gate = compile_gate(synth_events, length)
+            self.log.debug('synth %d gate: %s', index, gate)
+            self.scale_level(index, self.create_iter(gate, resolution))
+
+    def compile(self):
+        self.log.debug('start compile sequencer')
+        self.resolution = self.config.get('resolution', DEFAULT_RESOLUTION)
+        self.compile_tempo()
+        self.compile_clock()
+
+        for pattern in self.config.get('patterns', []):
+            self.compile_pattern(pattern)
+
+        if self.config.get('events'):
+            self.compile_events(self.config['events'])
+
+        self.stop()
+        self.log.debug('done compile sequencer')
+
+    def play(self, value=1):
+        '''Start the sequence from the beginning.  Accepts a MIDI control
+        value so that it can be used as a MIDI listener.'''
+        if value:
+            self.log.info('starting sequencer')
+            for it in self._iters:
+                it.reset()
+            self.clock.play()
+
+    def stop(self, value=1):
+        '''Stop the sequence.  Synth parameters keep the value of the
+        last step.'''
+        if value:
+            self.log.info('stopping sequencer')
+            self.clock.stop()
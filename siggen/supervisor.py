@@ -0,0 +1,254 @@
+'''An event loop for the siggen runtime.
+
+The supervisor runs on the main thread and sleeps in `select` on a
+self-pipe until there is something to do: a signal arrives (signals
+are delivered through `signal.set_wakeup_fd`, so they wake the loop
+immediately no matter which thread the kernel interrupted), another
+thread hands it a callback with `call_soon_threadsafe`, or a timer
+expires.
+
+MIDI callbacks from PYO run on the audio thread and must return
+quickly, so they `submit` work to a control worker thread instead.
+Longer running background tasks are started with `start_worker`; each
+worker receives a `threading.Event` that is set when the supervisor
+shuts down.
+'''
+
+import errno
+import fcntl
+import heapq
+import itertools
+import logging
+import os
+import select
+import signal
+import threading
+import time
+
+from collections import deque
+from six.moves import queue
+
+LOG = logging.getLogger(__name__)
+
+
+class Timer(object):
+    '''A handle for a callback scheduled with `call_later` or
+    `call_every`.'''
+
+    def __init__(self, when, func, args, interval=None):
+        self.when = when
+        self.func = func
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Worker(object):
+    '''A handle for a background thread started with `start_worker`.'''
+
+    def __init__(self, name, target, args):
+        self.name = name
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(name=name,
+                                       target=self.run,
+                                       args=(target, args))
+        self.thread.daemon = True
+
+    def run(self, target, args):
+        try:
+            target(self.stop_event, *args)
+        except Exception:
+            LOG.exception('worker %s failed', self.name)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            LOG.warn('worker %s did not stop', self.name)
+
+
+class Supervisor(object):
+    def __init__(self, join_timeout=1.0):
+        self.init_log()
+
+        self.join_timeout = join_timeout
+        self._pending = deque()
+        self._timers = []
+        self._seq = itertools.count()
+        self._workers = []
+        self._signals = {}
+        self._control = queue.Queue()
+        self._running = False
+
+        self._rfd, self._wfd = os.pipe()
+        for fd in (self._rfd, self._wfd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self._control_worker = self.start_worker('control',
+                                                 self.control_worker)
+
+    def init_log(self):
+        self.log = logging.getLogger('%s.%s' % (
+            __name__, self.__class__.__name__))
+
+    def wakeup(self):
+        '''Wake up the event loop.  Safe to call from any thread or
+        from a signal handler.'''
+        try:
+            os.write(self._wfd, b'\0')
+        except OSError as err:
+            # the pipe is full, so the loop is going to wake up anyway
+            if err.errno != errno.EAGAIN:
+                raise
+
+    def call_soon_threadsafe(self, func, *args):
+        '''Arrange for _func_ to be called from the event loop.  This
+        may be called from any thread, including PYO callbacks.'''
+        self._pending.append((func, args))
+        self.wakeup()
+
+    def call_later(self, delay, func, *args):
+        '''Arrange for _func_ to be called from the event loop after
+        _delay_ seconds.  Returns a Timer that can be cancelled.  Timers
+        must be created from the event loop thread.'''
+        return self.add_timer(Timer(time.time() + delay, func, args))
+
+    def call_every(self, interval, func, *args):
+        '''Arrange for _func_ to be called from the event loop every
+        _interval_ seconds.  Returns a Timer that can be cancelled.'''
+        return self.add_timer(Timer(time.time() + interval, func, args,
+                                    interval=interval))
+
+    def add_timer(self, timer):
+        heapq.heappush(self._timers, (timer.when, next(self._seq), timer))
+        self.wakeup()
+        return timer
+
+    def submit(self, func, *args):
+        '''Run _func_ on the control worker thread.  MIDI listeners are
+        dispatched this way so that slow actions (ALSA mixer updates,
+        external scripts) never run on the audio thread or block the
+        event loop.'''
+        self._control.put((func, args))
+
+    def control_worker(self, stop):
+        while not stop.is_set():
+            job = self._control.get()
+            if job is None:
+                break
+
+            func, args = job
+            self.run_callback(func, args)
+
+    def start_worker(self, name, target, *args):
+        '''Start a background thread running
+        `target(stop_event, *args)`.  The worker should return promptly
+        once `stop_event` is set.  Returns a Worker handle.'''
+        self.log.debug('starting worker %s', name)
+        worker = Worker(name, target, args)
+        self._workers.append(worker)
+        worker.start()
+        return worker
+
+    def stop_worker(self, worker):
+        '''Stop a worker started with `start_worker` and wait for it to
+        exit.'''
+        self.log.debug('stopping worker %s', worker.name)
+        if worker is self._control_worker:
+            self._control.put(None)
+
+        worker.stop(self.join_timeout)
+        if worker in self._workers:
+            self._workers.remove(worker)
+
+    def add_signal_handler(self, signum, func, *args):
+        '''Call _func_ from the event loop when signal _signum_ is
+        received.'''
+        self._signals[signum] = signal.signal(
+            signum,
+            lambda *_: self.call_soon_threadsafe(func, *args))
+
+    def run_callback(self, func, args):
+        try:
+            func(*args)
+        except Exception:
+            self.log.exception('error in callback %s', func)
+
+    def run_pending(self):
+        while self._pending:
+            func, args = self._pending.popleft()
+            self.run_callback(func, args)
+
+    def run_timers(self):
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+
+            self.run_callback(timer.func, timer.args)
+
+            if timer.interval is not None and not timer.cancelled:
+                timer.when += timer.interval
+                heapq.heappush(self._timers,
+                               (timer.when, next(self._seq), timer))
+
+    def next_timeout(self):
+        if not self._timers:
+            return None
+
+        return max(0, self._timers[0][0] - time.time())
+
+    def drain(self):
+        try:
+            while os.read(self._rfd, 4096):
+                pass
+        except OSError as err:
+            if err.errno != errno.EAGAIN:
+                raise
+
+    def run(self):
+        '''Run the event loop until `stop` is called.'''
+        self.log.debug('starting event loop')
+        old_wakeup_fd = signal.set_wakeup_fd(self._wfd)
+        self._running = True
+
+        try:
+            while self._running:
+                try:
+                    select.select([self._rfd], [], [], self.next_timeout())
+                except (select.error, OSError) as err:
+                    if err.args[0] != errno.EINTR:
+                        raise
+
+                self.drain()
+                self.run_pending()
+                self.run_timers()
+        finally:
+            signal.set_wakeup_fd(old_wakeup_fd)
+
+        self.log.debug('event loop stopped')
+
+    def stop(self):
+        '''Stop the event loop.  Safe to call from any thread.'''
+        self._running = False
+        self.wakeup()
+
+    def close(self):
+        '''Stop all workers, restore signal handlers and release the
+        self-pipe.'''
+        for worker in list(reversed(self._workers)):
+            self.stop_worker(worker)
+
+        for signum, handler in self._signals.items():
+            signal.signal(signum, handler)
+
+        os.close(self._rfd)
+        os.close(self._wfd)
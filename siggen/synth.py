@@ -9,27 +9,70 @@ except ImportError:
     alsamixer = None
 
 from itertools import cycle
+import gc
 import logging
+import threading
+import time
 import pyo
 
+from . import analysis
+from . import curves
+from . import morph
+from . import sequencer
 from .exc import *  # NOQA
+from .profile import load_host_profile
 
 FREQ_A0 = 27.5
 FREQ_C8 = 4186
 FREQ_C4 = 261.626
 DEFAULT_NHARMONICS = 30
 DEFAULT_TSIZE = 8192
+DEFAULT_NCHNLS = 2
+MORPH_FRAMES = ['sine', 'triangle', 'square', 'sawtooth']
+HEARTBEAT_INTERVAL = 0.05
+XRUN_BUFFERS = 2
+MIDI_CONTROL_CHANGE = 0xB0
+FREQ_DEFAULTS = {'curve': 'note'}
+VOLUME_DEFAULTS = {'curve': 'linear', 'min': 0, 'max': 1}
+KEY_CURVE = curves.get_curve({'curve': 'key'})
+VOLUME_CURVE = curves.get_curve(VOLUME_DEFAULTS)
 LOG = logging.getLogger(__name__)
 
 
 def calc_key_freq(value):
     '''Given a midi control value, calculate the corresponding piano
     key and return the appropriate frequency.'''
-    key = int((value/127.0) * 88)
-    freq = 2 ** ((key-49)/12) * 440
-    LOG.debug('freq control value %d -> key %d -> freq %f',
-              value, key, freq)
-    return freq
+    return KEY_CURVE(value)
+
+
+def triangle_harmonics(nharmonics):
+    '''Return the list of harmonic amplitudes used to approximate a
+    triangle wave with _nharmonics_ terms.'''
+    c = cycle([1, -1])
+    return [next(c)/(i*i) if i % 2 == 1 else 0
+            for i in range(1, (2*nharmonics))]
+
+
+def create_additive_table(kind, tsize, nharmonics):
+    '''Create a wave table for one of the additive synth types
+    (`square`, `sawtooth` or `triangle`), or a sine table.'''
+    if kind == 'square':
+        return pyo.SquareTable(order=nharmonics, size=tsize)
+    elif kind == 'sawtooth':
+        return pyo.SawTable(order=nharmonics, size=tsize)
+    elif kind == 'triangle':
+        return pyo.HarmTable(list=triangle_harmonics(nharmonics),
+                             size=tsize)
+    elif kind == 'sine':
+        return pyo.HarmTable(list=[1], size=tsize)
+
+    raise UnknownSynthType(kind)
+
+
+def dispatch_now(func, *args):
+    '''The default MIDI dispatcher, which calls listeners directly on
+    the PYO callback thread.'''
+    func(*args)
 
 
 def discover_pa_devices():
@@ -53,36 +96,53 @@ class Synth(object):
                  mixers=None,
                  controls=None,
                  nharmonics=None,
-                 tsize=None):
+                 tsize=None,
+                 profile=None,
+                 dispatch=None,
+                 sequence=None):
 
         self.init_log()
 
         self.synths = synths
         self.mixers = mixers
         self.controls = controls
+        self.sequence = sequence
+        self.dispatch = dispatch if dispatch is not None else dispatch_now
 
         self.audio = audio
         self.inputDevice = inputDevice
         self.outputDevice = outputDevice
         self.midiDevice = midiDevice
+        self.nchnls = (
+            outputDeviceChannels if outputDeviceChannels is not None
+            else DEFAULT_NCHNLS)
 
-        self.nharmonics = (
-            nharmonics if nharmonics is not None
-            else DEFAULT_NHARMONICS)
-        self.tsize = (
-            tsize if tsize is not None
-            else DEFAULT_TSIZE)
+        self.nharmonics = nharmonics
+        self.tsize = tsize
+        self.profile = (
+            profile if profile is not None
+            else load_host_profile())
 
-        self.log.debug('table params: tsize = %d, nharmonics = %d',
+        self.log.debug('table params: tsize = %s, nharmonics = %s',
                        self.tsize, self.nharmonics)
 
+        self._listen = {}
+        self._cc = {}
+        self._table_cache = {}
+        self._curve_tables = {}
+        self._analysis_sources = []
+        self._lock = threading.RLock()
+        self.analyzers = []
+        self.playing = True
+        self.running = False
+        self.xruns = []
+
         self.discover_devices()
 
         kwargs = {}
         if audio is not None:
             kwargs['audio'] = audio
-        if outputDeviceChannels is not None:
-            kwargs['nchnls'] = outputDeviceChannels
+        kwargs['nchnls'] = self.nchnls
         if inputDeviceChannels is not None:
             kwargs['ichnls'] = inputDeviceChannels
 
@@ -109,15 +169,69 @@ class Synth(object):
 
             self.server.setMidiInputDevice(midiDevice)
 
+        # If the synth cannot be built, release whatever was created so
+        # that another synth can be created in this process.
+        try:
+            self.boot_server()
+            self.init_controls()
+            self.init_graph()
+            self.init_mixers()
+        except Exception:
+            self.shutdown()
+            raise
+
+        self.running = True
+
+    def boot_server(self):
         self.server.boot()
         self.server.start()
         if not self.server.getIsBooted() or not self.server.getIsStarted():
             raise BootFailed()
 
+    def init_graph(self):
+        '''Create all the PYO objects.  This is called at startup and
+        again after the server has been restarted by `restart`.'''
         self.init_listeners()
-        self.init_controls()
         self.init_synths()
-        self.init_mixers()
+        self.init_sequencer()
+        self.init_analysis()
+        self.init_heartbeat()
+
+    def release_graph(self):
+        '''Drop all references to PYO objects created by `init_graph`.
+        PYO objects must be freed before the server they were created
+        on is shut down.'''
+        for a in self.analyzers:
+            a.detach()
+            a.unsubscribe_all()
+
+        self._synths = []
+        self._outputs = []
+        self._analysis_sources = []
+        self.sequencer = None
+        self._listener = None
+        self._heartbeat = None
+        self._heartbeat_metro = None
+        self._curve_tables = {}
+        gc.collect()
+
+    def restart(self):
+        '''Shut down and re-boot the sound server, then rebuild the
+        synths from the configuration.  Wave tables are rebuilt from
+        cached samples, and controls are restored to the last values
+        received from the MIDI controller.'''
+        with self._lock:
+            if not self.running:
+                return
+
+            self.log.warn('restarting sound server')
+            self.release_graph()
+            self.server.shutdown()
+            self.boot_server()
+            self.init_graph()
+
+            if not self.playing:
+                self.ctrl_stop(1)
 
     def init_log(self):
         self.log = logging.getLogger('%s.%s' % (
@@ -157,10 +271,48 @@ class Synth(object):
 
         raise MissingPMInputDevice(want)
 
+    def table_params(self, kind):
+        '''Return the (tsize, nharmonics) tuple to use for synth type
+        _kind_.  Values from the configuration take precedence over
+        values from the host profile (see `siggen tune`), which take
+        precedence over the defaults.'''
+        tuned = self.profile.get('tables', {}).get(kind, {})
+
+        tsize = (
+            self.tsize if self.tsize is not None
+            else tuned.get('tsize', DEFAULT_TSIZE))
+        nharmonics = (
+            self.nharmonics if self.nharmonics is not None
+            else tuned.get('nharmonics', DEFAULT_NHARMONICS))
+
+        self.log.debug('%s table params: tsize = %d, nharmonics = %d',
+                       kind, tsize, nharmonics)
+        return tsize, nharmonics
+
+    def cached_table(self, key, factory):
+        '''Return a wave table for _key_.  The first time a table is
+        requested it is created by calling _factory_, and its samples
+        are saved; after that (for example, after a server restart)
+        the table is rebuilt from the saved samples.'''
+        if key in self._table_cache:
+            samples = self._table_cache[key]
+            return pyo.DataTable(size=len(samples), init=samples)
+
+        t = factory()
+        self._table_cache[key] = t.getTable()
+        return t
+
+    def create_table(self, kind):
+        '''Create the wave table for additive synth type _kind_.'''
+        tsize, nharmonics = self.table_params(kind)
+        return self.cached_table(
+            (kind, tsize, nharmonics),
+            partial(create_additive_table, kind, tsize, nharmonics))
+
     def create_synth_sine(self):
         '''Create a sine wave synthesizer.'''
         self.log.debug('creating sine synth')
-        return pyo.Sine(mul=0, freq=[FREQ_C4, FREQ_C4])
+        return pyo.Sine(mul=0, freq=FREQ_C4)
 
     def create_synth_square_line(self):
         '''Create a square wave synthesizer using the PYO
@@ -170,17 +322,17 @@ class Synth(object):
                           ((8192//2), -1), (8191, -1)])
         return pyo.Osc(table=t,
                        mul=0,
-                       freq=[FREQ_C4, FREQ_C4])
+                       freq=FREQ_C4)
 
     def create_synth_square(self):
         '''Create a square wave synthesizer as a sum of sines
         using the PYO SquareTable module (which internally
         calls HarmTable).'''
         self.log.debug('creating square synth [additive]')
-        t = pyo.SquareTable(order=self.nharmonics, size=self.tsize)
+        t = self.create_table('square')
         return pyo.Osc(table=t,
                        mul=0,
-                       freq=[FREQ_C4, FREQ_C4])
+                       freq=FREQ_C4)
 
     def create_synth_sawtooth_line(self):
         '''Create a sawtooth wave synthesizer using the PYO
@@ -189,17 +341,17 @@ class Synth(object):
         t = pyo.LinTable([(0, 1), (8191, -1)])
         return pyo.Osc(table=t,
                        mul=0,
-                       freq=[FREQ_C4, FREQ_C4])
+                       freq=FREQ_C4)
 
     def create_synth_sawtooth(self):
         '''Create a sawtooth wave synthesizer as a sum of sines
         using the PYO SawTable module (which internally
         calls HarmTable).'''
         self.log.debug('creating sawtooth synth [additive]')
-        t = pyo.SawTable(order=self.nharmonics, size=self.tsize)
+        t = self.create_table('sawtooth')
         return pyo.Osc(table=t,
                        mul=0,
-                       freq=[FREQ_C4, FREQ_C4])
+                       freq=FREQ_C4)
 
     def create_synth_triangle_line(self):
         '''Create a triangle wave synthesizer using the PYO
@@ -209,31 +361,149 @@ class Synth(object):
                           (3*(8192//4), -1), (8191, 0)])
         return pyo.Osc(table=t,
                        mul=0,
-                       freq=[FREQ_C4, FREQ_C4])
+                       freq=FREQ_C4)
 
     def create_synth_triangle(self):
         '''Create a sawtooth wave synthesizer as a sum of sines
         using the PYO HarmTable module.'''
         self.log.debug('creating triangle synth [additive]')
-        c = cycle([1, -1])
-        l = [next(c)/(i*i) if i % 2 == 1 else 0
-             for i in range(1, (2*self.nharmonics))]
-        t = pyo.HarmTable(list=l, size=self.tsize)
+        t = self.create_table('triangle')
         return pyo.Osc(table=t,
                        mul=0,
-                       freq=[FREQ_C4, FREQ_C4])
+                       freq=FREQ_C4)
+
+    def create_synth_morph(self):
+        '''Create a synthesizer that morphs between the sine, triangle,
+        square and sawtooth waveforms using a single oscillator.  The
+        waveforms are stored as adjacent frames of one table.'''
+        self.log.debug('creating morph synth')
+
+        # Each frame uses the harmonic count for its own synth type.
+        # The frames must all be the same size, so they use the largest
+        # of the table sizes for the additive types (a sine frame is
+        # exact at any size).
+        params = dict((kind, self.table_params(kind))
+                      for kind in MORPH_FRAMES)
+        tsize = max(params[kind][0] for kind in MORPH_FRAMES
+                    if kind != 'sine')
+        harmonics = tuple(params[kind][1] for kind in MORPH_FRAMES)
+
+        t = self.cached_table(
+            ('morph', tsize, harmonics),
+            lambda: morph.create_frame_stack(
+                [create_additive_table(kind, tsize, nharmonics)
+                 for kind, nharmonics in zip(MORPH_FRAMES, harmonics)]))
+        return morph.MorphOsc(t, len(MORPH_FRAMES),
+                              mul=0,
+                              freq=FREQ_C4)
 
     def create_synth_passthrough(self):
         '''Create a "synth" that will pass audio on the input channel to 
-        your output channel(s).'''
+        your output channel(s).  Only the first input channel is used.'''
         self.log.debug('creating passthrough synth')
-        i = pyo.Input()
-        return pyo.Mix(i, voices=2, mul=0)
+        return pyo.Input(mul=0)
+
+    def create_synth_output(self, synth, source):
+        '''Route the mono _source_ to the output channels requested by
+        the synth configuration.  The source is computed once and the
+        result is copied (or panned) to each output channel, so adding
+        channels does not add oscillators.  Returns a (object, chnl)
+        tuple suitable for passing to `out()`.'''
+
+        if 'pan' in synth:
+            self.log.debug('panning synth across %d channels (pan = %f)',
+                           self.nchnls, synth['pan'])
+            return (pyo.Pan(source, outs=self.nchnls, pan=synth['pan']), 0)
+
+        channels = synth.get('channels', list(range(self.nchnls)))
+        if not isinstance(channels, list):
+            channels = [channels]
+
+        for chnl in channels:
+            if not 0 <= chnl < self.nchnls:
+                raise InvalidOutputChannel(chnl)
+
+        self.log.debug('routing synth to channels %s', channels)
+        if len(channels) == 1:
+            return (source, channels[0])
+
+        return (pyo.Mix(source, voices=len(channels)), channels)
+
+    def midictl(self, control, minscale=0, maxscale=1, init=None):
+        '''Create a Midictl for _control_, initialized from the last
+        value received for that control.  If no value has been received
+        the Midictl starts at _init_ (or _minscale_).'''
+        if control in self._cc:
+            init = minscale + (maxscale - minscale) * self._cc[control] / 127
+        elif init is None:
+            init = minscale
+
+        return pyo.Midictl(control, minscale=minscale, maxscale=maxscale,
+                           init=init)
+
+    def curve_table(self, curve):
+        '''Return a PYO table holding the values of _curve_.  Tables are
+        shared by all the controls that use the same curve.'''
+        if curve not in self._curve_tables:
+            self._curve_tables[curve] = pyo.DataTable(size=curve.size,
+                                                      init=curve.table)
+
+        return self._curve_tables[curve]
+
+    def control_signal(self, mapping, defaults=None, init=None):
+        '''Return a PYO object that follows the MIDI control described
+        by _mapping_ (see `curves.parse_mapping`), converted by a table
+        lookup in the control's curve.  If no value has been received
+        for the control, the signal starts at the curve value closest
+        to _init_.'''
+        control, spec = curves.parse_mapping(mapping, defaults)
+        curve = curves.get_curve(spec)
+        raw = curve.nearest(init) if init is not None else 0
+
+        msb = self.midictl(control, minscale=0, maxscale=127,
+                           init=raw >> 7 if curve.bits == 14 else raw)
+        msb.setInterpolation(False)
+
+        if curve.bits == 14:
+            lsb = self.midictl(control + 32, minscale=0, maxscale=127,
+                               init=raw & 127)
+            lsb.setInterpolation(False)
+            index = msb * 128 + lsb
+        else:
+            index = msb
+
+        # Midictl scales the control value as a float; round it before
+        # TableIndex truncates it to an integer index.
+        return pyo.TableIndex(self.curve_table(curve), index + 0.5)
+
+    def register_control(self, mapping, func, defaults=None):
+        '''Register a listener that calls _func_ with the value of the
+        MIDI control described by _mapping_, converted by the control's
+        curve.  14-bit controls are registered for both halves of the
+        control value.'''
+        control, spec = curves.parse_mapping(mapping, defaults)
+        curve = curves.get_curve(spec)
+
+        if curve.bits == 14:
+            handler = partial(self.handle_14bit_control, control, curve, func)
+            self.register_midi_listener(control, handler)
+            self.register_midi_listener(control + 32, handler)
+        else:
+            self.register_midi_listener(
+                control, partial(self.handle_control, curve, func))
+
+    def handle_control(self, curve, func, value):
+        func(curve(value))
+
+    def handle_14bit_control(self, control, curve, func, value):
+        func(curve(curves.combine(self._cc.get(control, 0),
+                                  self._cc.get(control + 32, 0))))
 
     def init_synths(self):
         '''Initialize and start all the synthesizers (with an initial
         volume of 0).'''
         self._synths = []
+        self._outputs = []
         self.log.debug('start init synths')
 
         for i, synth in enumerate(self.synths):
@@ -247,28 +517,165 @@ class Synth(object):
 
             s = func()
             self._synths.append(s)
+            self._outputs.append(self.create_synth_output(synth, s))
 
             if 'volume' in synth:
-                m = pyo.Midictl(synth['volume'])
-                m.setInterpolation(False)
-                s.setMul(m)
+                s.setMul(self.control_signal(synth['volume'],
+                                             VOLUME_DEFAULTS))
 
             if 'freq' in synth:
-                m = pyo.Midictl(synth['freq'], minscale=0, maxscale=127)
-                m.setInterpolation(False)
-                hz = pyo.MToF(m)
-                s.setFreq(hz)
+                s.setFreq(self.control_signal(synth['freq'],
+                                              FREQ_DEFAULTS))
+
+            if 'morph' in synth:
+                s.setMorph(self.control_signal(
+                    synth['morph'],
+                    {'curve': 'linear', 'min': 0, 'max': s.frames - 1}))
 
-        for i, synth in enumerate(self._synths):
+        for i, (output, chnl) in enumerate(self._outputs):
             self.log.debug('activating synth %d', i)
-            synth.out()
+            output.out(chnl)
 
         self.log.debug('done init synths')
 
+    def init_sequencer(self):
+        '''Compile the sequencer configuration (if any).'''
+        self.sequencer = None
+        if not self.sequence:
+            return
+
+        self.sequencer = sequencer.Sequencer(self.sequence,
+                                             self._synths,
+                                             self.synths,
+                                             self.control_signal)
+
+        if self.sequence.get('autostart', True):
+            self.sequencer.play()
+
+    def init_analysis(self):
+        '''Initialize analysis of the synths that have an `analysis`
+        section.  The analyzers are created here, but must be run on
+        background threads by the caller.  After a server restart the
+        existing analyzers are attached to the new synths, so the
+        threads running them are unaffected.'''
+        if not any('analysis' in synth for synth in self.synths):
+            return
+
+        if analysis.numpy is None:
+            self.log.warn('no analysis support (numpy is not available)')
+            return
+
+        self.log.debug('start init analysis')
+
+        existing = list(self.analyzers)
+        for i, synth in enumerate(self.synths):
+            if 'analysis' not in synth:
+                continue
+
+            options = synth['analysis']
+            options = dict(options) if isinstance(options, dict) else {}
+            follow = options.pop('follow', [])
+            tap = options.pop('tap', 'pre')
+
+            if existing:
+                a = existing.pop(0)
+                a.unsubscribe_all()
+            else:
+                self.log.debug('creating analyzer for synth %d', i)
+                a = analysis.Analyzer('synth%d' % i,
+                                      self.server.getSamplingRate(),
+                                      **options)
+                self.analyzers.append(a)
+
+            a.attach(self.create_analysis_source(i, synth, tap))
+
+            for target in follow:
+                self.init_follower(a, target)
+
+        self.log.debug('done init analysis')
+
+    def create_analysis_source(self, i, synth, tap):
+        '''Return the signal to analyze for synth _i_.  With _tap_
+        `post` this is the synth output, after the volume control.  With
+        _tap_ `pre` it is the synth signal at full volume: a separate
+        `Input` for `passthrough`, or a second copy of the oscillator
+        that shares the synth's frequency (and morph) controls.'''
+        s = self._synths[i]
+
+        if tap == 'post':
+            return s
+        elif tap != 'pre':
+            raise UnknownAnalysisParameter('tap: %s' % tap)
+
+        if synth['type'] == 'passthrough':
+            source = pyo.Input()
+        else:
+            source = getattr(self, 'create_synth_%(type)s' % synth)()
+            source.setMul(1)
+            source.setFreq(s.freq)
+            if synth['type'] == 'morph':
+                source.setMorph(s.morph)
+
+        self._analysis_sources.append(source)
+        return source
+
+    def init_follower(self, analyzer, target):
+        '''Make a synth parameter follow the results of _analyzer_.  The
+        `freq` parameter follows the estimated fundamental frequency
+        and the `volume` parameter follows the RMS level.  Changes are
+        smoothed over one analysis interval with `SigTo`.'''
+        s = self._synths[target['synth']]
+        param = target.get('param', 'freq')
+
+        self.log.debug('synth %d %s follows %s',
+                       target['synth'], param, analyzer.name)
+
+        if param == 'freq':
+            sig = pyo.SigTo(FREQ_C4, time=analyzer.interval, init=FREQ_C4)
+            s.setFreq(sig)
+            analyzer.subscribe(partial(self.follow, sig, 'freq'))
+        elif param == 'volume':
+            sig = pyo.SigTo(0, time=analyzer.interval)
+            s.setMul(sig)
+            analyzer.subscribe(partial(self.follow, sig, 'rms'))
+        else:
+            raise UnknownAnalysisParameter(param)
+
+    def follow(self, sig, key, result):
+        if result[key] is not None:
+            sig.setValue(result[key])
+
+    def init_heartbeat(self):
+        '''Call `heartbeat` from the audio thread every
+        HEARTBEAT_INTERVAL seconds.  The watchdog uses this to detect a
+        stalled audio callback.'''
+        self.last_heartbeat = time.time()
+        self._heartbeat_metro = pyo.Metro(HEARTBEAT_INTERVAL).play()
+        self._heartbeat = pyo.TrigFunc(self._heartbeat_metro,
+                                       self.heartbeat)
+
+        # The heartbeat runs in the audio callback for the buffer that
+        # contains the tick, so normally it is at most a buffer early
+        # or late.
+        self.xrun_threshold = (XRUN_BUFFERS *
+                               self.server.getBufferSize() /
+                               self.server.getSamplingRate())
+
+    def heartbeat(self):
+        '''Record the time of each heartbeat, and the time and lateness
+        of heartbeats that ran late.  The heartbeat needs the GIL, so
+        it can be late because of other Python threads even when the
+        audio is fine; the watchdog decides how late counts as an
+        xrun.'''
+        now = time.time()
+        late = now - self.last_heartbeat - HEARTBEAT_INTERVAL
+        if late > self.xrun_threshold:
+            self.log.debug('audio callback %.1f ms late', 1000 * late)
+            self.xruns.append((now, late))
+        self.last_heartbeat = now
+
     def init_listeners(self):
         '''Initialize handling of midi control messages.'''
-        self._listen = {}
-
         c = pyo.RawMidi(self.midi_handler)
 
         # apparently we need to store a reference to this or
@@ -290,35 +697,68 @@ class Synth(object):
                 self.controls['stop'],
                 self.ctrl_stop)
 
+        if self.sequence and 'play' in self.sequence:
+            self.register_midi_listener(
+                self.sequence['play'],
+                self.ctrl_sequencer_play)
+
+        if self.sequence and 'stop' in self.sequence:
+            self.register_midi_listener(
+                self.sequence['stop'],
+                self.ctrl_sequencer_stop)
+
         self.log.debug('done init controls')
 
+    # Listeners that touch PYO objects take self._lock, so that they
+    # never run while `restart` is replacing the graph.
+
     def ctrl_play(self, value):
         if value:
-            self.log.info('starting all synths')
-            for synth in self._synths:
-                synth.out()
+            with self._lock:
+                self.playing = True
+                self.log.info('starting all synths')
+                for synth, (output, chnl) in zip(self._synths,
+                                                 self._outputs):
+                    synth.play()
+                    output.out(chnl)
 
     def ctrl_stop(self, value):
         if value:
-            self.log.info('stopping all synths')
-            for synth in self._synths:
-                synth.stop()
+            with self._lock:
+                self.playing = False
+                self.log.info('stopping all synths')
+                for synth, (output, chnl) in zip(self._synths,
+                                                 self._outputs):
+                    output.stop()
+                    synth.stop()
+
+    def ctrl_sequencer_play(self, value):
+        with self._lock:
+            if self.sequencer is not None:
+                self.sequencer.play(value)
+
+    def ctrl_sequencer_stop(self, value):
+        with self._lock:
+            if self.sequencer is not None:
+                self.sequencer.stop(value)
 
     def init_mixer_device(self, tag, mixer, element, channel, control,
                           capture=False):
         self.log.debug('creating mixer tag = %s', tag)
 
+        minvol, maxvol = element.get_volume_range()
         self._mixer[tag] = {
             'mixer': mixer,
             'element': element,
             'capture': capture,
             'channel': alsamixer.channel_id[channel],
-            'range': element.get_volume_range(),
+            'range': (minvol, maxvol),
         }
 
-        self.register_midi_listener(
+        self.register_control(
             control,
-            partial(self.ctrl_mixer, tag))
+            partial(self.ctrl_mixer, tag),
+            defaults={'curve': 'linear', 'min': minvol, 'max': maxvol})
 
     def init_mixers(self):
         '''Initialize handling of ALSA mixer devices.'''
@@ -365,38 +805,45 @@ class Synth(object):
 
         self.log.debug('done init mixers')
 
-    def ctrl_mixer(self, name, value):
+    def ctrl_mixer(self, name, volume):
         e = self._mixer[name]['element']
         channel = self._mixer[name]['channel']
         capture = self._mixer[name]['capture']
-        minvol, maxvol = self._mixer[name]['range']
 
-        volume = int(minvol + (value/127) * (maxvol-minvol))
-        self.log.debug('mixer %s: set volume = %d (from %d)',
-                       name, volume, value)
+        volume = int(volume)
+        self.log.debug('mixer %s: set volume = %d', name, volume)
 
         e.set_volume(volume, channel, capture)
-        self._mixer_lock.release()
 
     def ctrl_freq(self, synth, value):
         freq = calc_key_freq(value)
         self.log.info('%d: set freq = %f', synth, freq)
-        self._synths[synth].setFreq(freq)
+        with self._lock:
+            self._synths[synth].setFreq(freq)
 
     def ctrl_volume(self, synth, value):
-        vol = value / 127
+        vol = VOLUME_CURVE(value)
         self.log.info('%d: set volume = %f', synth, vol)
-        self._synths[synth].setMul(vol)
+        with self._lock:
+            self._synths[synth].setMul(vol)
 
     def midi_handler(self, status, control, value):
         #self.log.debug('midi control %d value %d', control, value)
+
+        # only control values are restored after a restart
+        if status & 0xF0 == MIDI_CONTROL_CHANGE:
+            self._cc[control] = value
+
         if control in self._listen:
-            self._listen[control](value)
+            self.dispatch(self._listen[control], value)
 
     def shutdown(self):
         '''Shut down the sound server.'''
-        self.log.info('shutting down sound server')
-        self.server.shutdown()
+        with self._lock:
+            self.running = False
+            self.log.info('shutting down sound server')
+            self.release_graph()
+            self.server.shutdown()
 
     def register_midi_listener(self, control, func):
         '''Register a new listener _func_ for midi control
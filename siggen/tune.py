@@ -0,0 +1,295 @@
+'''Select wave table parameters for the current host.
+
+For each additive synth type, `tune` plays a wave table oscillator at
+several pitches with the PYO server in manual mode (so that nothing is
+written to disk) for every combination of table size and harmonic
+count, and measures:
+
+- `cpu` -- seconds spent rendering each second of audio
+- `build` -- seconds spent building the wave table
+- `memory` -- approximate size of the wave table in bytes
+- `error` -- relative RMS difference between the harmonics of the
+  rendered output and those of the ideal band-limited waveform
+- `aliasing` -- relative RMS level of the table harmonics above the
+  Nyquist frequency, which are folded back below it
+- `interpolation` -- relative RMS level of the errors introduced by
+  interpolating between table samples, which shrink as the table
+  grows
+
+Adding harmonics reduces the error at low pitches but increases the
+aliasing at high pitches, so the two are combined, for each pitch,
+into a `distortion` (the RMS of the error and the aliasing), which is
+averaged over the pitches.  The interpolation error is the worst value
+over all the pitches.
+
+The settings that are not dominated on cpu, build, memory, distortion
+and interpolation form the Pareto front.  Of those, settings whose
+distortion is more than `tolerance` worse than the best, or whose
+interpolation error is above `noise_floor`, are discarded, and the one
+with the smallest total relative cost is written to the host
+profile.
+'''
+
+from __future__ import division
+
+import logging
+import math
+import socket
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import pyo
+
+from . import profile
+from .synth import create_additive_table
+
+DEFAULT_TYPES = ['square', 'sawtooth', 'triangle']
+DEFAULT_TSIZES = [256, 512, 1024, 2048, 4096, 8192]
+DEFAULT_NHARMONICS = [10, 20, 30, 40, 60]
+DEFAULT_DURATION = 10
+DEFAULT_TOLERANCE = 0.1
+DEFAULT_NOISE_FLOOR = 1e-4
+DEFAULT_SR = 44100
+BUFFER_SIZE = 256
+SAMPLE_BYTES = 4
+
+# The pitches are whole numbers of Hz, so that a one second recording
+# holds a whole number of cycles and every harmonic falls on an FFT
+# bin.  None of them divides the sample rate, so aliases do not fall
+# on harmonics.
+PITCHES = [55, 220, 880, 3520]
+RECORD_LENGTH = 1
+
+OBJECTIVES = ['cpu', 'build', 'memory', 'distortion', 'interpolation']
+COSTS = ['cpu', 'build', 'memory']
+LOG = logging.getLogger(__name__)
+
+
+def ideal_square(k):
+    return 4 / (math.pi * k) if k % 2 else 0
+
+
+def ideal_sawtooth(k):
+    return 2 / (math.pi * k)
+
+
+def ideal_triangle(k):
+    return 8 / (math.pi * k) ** 2 if k % 2 else 0
+
+IDEAL = {
+    'square': ideal_square,
+    'sawtooth': ideal_sawtooth,
+    'triangle': ideal_triangle,
+}
+
+
+def fold(freq, sr=DEFAULT_SR):
+    '''Return the frequency at which _freq_ appears when sampled at
+    _sr_.'''
+    freq = freq % sr
+    return sr - freq if freq > sr / 2 else freq
+
+
+def spectral_error(kind, nharmonics, samples, freq, sr=DEFAULT_SR):
+    '''Analyze _samples_, a whole number of cycles of an _nharmonics_
+    harmonic table of synth type _kind_ played at _freq_.  Returns a
+    dictionary with:
+
+    - `error` -- the relative RMS error of the harmonics below the
+      Nyquist frequency, compared to the ideal band-limited waveform
+    - `aliasing` -- the relative RMS level of the table harmonics
+      above the Nyquist frequency, which are folded back below it
+    - `interpolation` -- the relative RMS difference between the
+      output and the harmonics the table was built with
+
+    The output is scaled by the least-squares gain first, since PYO
+    does not normalize additive tables.'''
+    spectrum = numpy.abs(numpy.fft.rfft(samples))
+    spectrum[0] = 0
+    scale = len(samples) / sr
+
+    def level(bins):
+        return spectrum[numpy.array(bins, dtype=int)]
+
+    def gain(measured, ideal):
+        energy = numpy.dot(measured, measured)
+        return numpy.dot(measured, ideal) / energy if energy else 0
+
+    def relative(err, ideal):
+        return math.sqrt(err / numpy.dot(ideal, ideal))
+
+    # the ideal band-limited waveform
+    nyquist = int((sr / 2 - 1) // freq)
+    ideal = numpy.array([IDEAL[kind](k) for k in range(1, nyquist + 1)])
+    measured = level([round(k * freq * scale)
+                      for k in range(1, nyquist + 1)])
+    g = gain(measured, ideal)
+    error = relative(numpy.sum(numpy.square(g * measured - ideal)), ideal)
+
+    # the harmonics in the table, wherever they were folded to.  The
+    # harmonic count only includes the harmonics that are present
+    # (the odd harmonics of a square or triangle wave).
+    present = [k for k in range(1, 2 * nharmonics + 1) if IDEAL[kind](k)]
+    harmonics = present[:nharmonics]
+    designed = numpy.array([IDEAL[kind](k) for k in harmonics])
+    bins = [round(fold(k * freq, sr) * scale) for k in harmonics]
+    table = level(bins)
+    g = gain(table, designed)
+    folded = g * table[numpy.array(harmonics) > nyquist]
+    aliasing = relative(numpy.dot(folded, folded), ideal)
+
+    # everything else (images and errors introduced by interpolating
+    # between table samples)
+    other = (numpy.dot(spectrum, spectrum) -
+             numpy.sum(numpy.square(level(sorted(set(bins))))))
+    err = (numpy.sum(numpy.square(g * table - designed)) +
+           g * g * max(0, other))
+    interpolation = relative(err, designed)
+
+    return {
+        'error': error,
+        'aliasing': aliasing,
+        'interpolation': interpolation,
+    }
+
+
+def measure(server, kind, tsize, nharmonics, duration):
+    '''Render _duration_ seconds of synth type _kind_ at each of the
+    `PITCHES`, and return a dictionary of measurements.'''
+    server.boot()
+
+    try:
+        t0 = time.time()
+        t = create_additive_table(kind, tsize, nharmonics)
+        build = time.time() - t0
+
+        oscs = [pyo.Osc(table=t, freq=freq) for freq in PITCHES]
+        tables = [pyo.NewTable(length=RECORD_LENGTH) for freq in PITCHES]
+        recs = [pyo.TableRec(osc, table=table, fadetime=0).play()
+                for osc, table in zip(oscs, tables)]
+
+        server.start()
+        # render well past the end of the recordings, which may not
+        # start until the second buffer.
+        buffers = int(max(duration, 2 * RECORD_LENGTH) *
+                      DEFAULT_SR / BUFFER_SIZE)
+        t0 = time.time()
+        for i in range(buffers):
+            server.process()
+        cpu = ((time.time() - t0) * DEFAULT_SR /
+               (buffers * BUFFER_SIZE) / len(PITCHES))
+        server.stop()
+
+        results = [spectral_error(kind, nharmonics,
+                                  numpy.array(table.getTable()), freq)
+                   for table, freq in zip(tables, PITCHES)]
+    finally:
+        # PYO objects must be released before their server is shut
+        # down.
+        oscs = tables = recs = t = None
+        server.shutdown()
+
+    return {
+        'tsize': tsize,
+        'nharmonics': nharmonics,
+        'cpu': cpu,
+        'build': build,
+        'memory': tsize * SAMPLE_BYTES,
+        'error': mean([r['error'] for r in results]),
+        'aliasing': mean([r['aliasing'] for r in results]),
+        'distortion': mean([math.hypot(r['error'], r['aliasing'])
+                            for r in results]),
+        'interpolation': max(r['interpolation'] for r in results),
+    }
+
+
+def mean(values):
+    return sum(values) / len(values)
+
+
+def dominates(a, b):
+    '''True if result _a_ is no worse than _b_ on every objective and
+    better on at least one.'''
+    return (all(a[k] <= b[k] for k in OBJECTIVES) and
+            any(a[k] < b[k] for k in OBJECTIVES))
+
+
+def pareto_front(results):
+    return [r for r in results
+            if not any(dominates(o, r) for o in results)]
+
+
+def select_best(front, tolerance=DEFAULT_TOLERANCE,
+                noise_floor=DEFAULT_NOISE_FLOOR):
+    '''Pick the cheapest point on the Pareto front whose distortion is
+    within _tolerance_ (relative) of the smallest on the front, and
+    whose interpolation error is below _noise_floor_ (or the smallest
+    on the front, if none is).  The cost
+    is the sum of the `COSTS`, each relative to the largest value
+    considered, so that differences that are small compared to the
+    values themselves (such as timing noise) count for little.'''
+    limit = min(r['distortion'] for r in front) * (1 + tolerance)
+    acceptable = [r for r in front if r['distortion'] <= limit]
+
+    limit = max(noise_floor, min(r['interpolation'] for r in acceptable))
+    acceptable = [r for r in acceptable if r['interpolation'] <= limit]
+
+    scale = {}
+    for k in COSTS:
+        scale[k] = max(r[k] for r in acceptable)
+
+    def cost(r):
+        return sum(r[k] / scale[k] for k in COSTS if scale[k])
+
+    return min(acceptable, key=cost)
+
+
+def tune(types=None, tsizes=None, nharmonics=None,
+         duration=DEFAULT_DURATION):
+    '''Measure all combinations of _tsizes_ and _nharmonics_ for each
+    synth type in _types_, and return a host profile containing the
+    best settings for each type.'''
+    types = types or DEFAULT_TYPES
+    tsizes = tsizes or DEFAULT_TSIZES
+    nharmonics = nharmonics or DEFAULT_NHARMONICS
+
+    server = pyo.Server(audio='manual', nchnls=1, sr=DEFAULT_SR,
+                        buffersize=BUFFER_SIZE)
+
+    tables = {}
+    for kind in types:
+        results = []
+        for tsize in tsizes:
+            for n in nharmonics:
+                LOG.info('measuring %s: tsize = %d, nharmonics = %d',
+                         kind, tsize, n)
+                results.append(measure(server, kind, tsize, n, duration))
+
+        best = select_best(pareto_front(results))
+        LOG.warn('%s: tsize = %d, nharmonics = %d '
+                 '(cpu %.4f, error %.4f, aliasing %.4f, '
+                 'distortion %.4f, interpolation %.6f)',
+                 kind, best['tsize'], best['nharmonics'],
+                 best['cpu'], best['error'], best['aliasing'],
+                 best['distortion'], best['interpolation'])
+        tables[kind] = {
+            'tsize': best['tsize'],
+            'nharmonics': best['nharmonics'],
+        }
+
+    return {
+        'host': socket.gethostname(),
+        'tables': tables,
+    }
+
+
+def main(duration=DEFAULT_DURATION):
+    '''Tune the current host and save the results in the host
+    profile.'''
+    host_profile = profile.load_host_profile()
+    host_profile.update(tune(duration=duration))
+    return profile.save_host_profile(host_profile)
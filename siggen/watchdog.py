@@ -0,0 +1,132 @@
+'''Detect a failed sound server and restart it in-process.
+
+The Synth heartbeat (a `TrigFunc` run from the audio thread) records
+when the audio callback last ran and when it fell behind.  The
+watchdog runs on a supervisor worker thread and restarts the synth if:
+
+- the server is no longer running,
+- the audio callback has not run for `timeout` seconds, or
+- the audio callback fell behind at least `xruns` times in the last
+  `window` seconds.  The audio callback has fallen behind when the
+  heartbeat runs more than `lateness` seconds (or two buffers, if that
+  is longer) later than expected.  The heartbeat is Python code that
+  competes with other threads for the GIL, so `lateness` must be well
+  above normal scheduling delays.
+
+Restarting the synth re-boots the existing PYO server and rebuilds the
+synths from the configuration and cached wave tables, which is much
+faster than restarting the whole process.  If a restart fails, the
+watchdog waits longer before each new attempt, and after `retries`
+failed attempts in a row it calls `on_failure` and stops, so that the
+process can exit and be restarted by the service manager.
+'''
+
+import logging
+import time
+
+DEFAULT_TIMEOUT = 0.5
+DEFAULT_INTERVAL = 0.1
+DEFAULT_XRUNS = 5
+DEFAULT_WINDOW = 10
+DEFAULT_LATENESS = 0.02
+DEFAULT_RETRIES = 5
+MAX_BACKOFF = 5
+
+
+class Watchdog(object):
+    def __init__(self, synth,
+                 timeout=DEFAULT_TIMEOUT,
+                 interval=DEFAULT_INTERVAL,
+                 xruns=DEFAULT_XRUNS,
+                 window=DEFAULT_WINDOW,
+                 lateness=DEFAULT_LATENESS,
+                 retries=DEFAULT_RETRIES,
+                 on_failure=None):
+
+        self.init_log()
+
+        self.synth = synth
+        self.timeout = timeout
+        self.interval = interval
+        self.xruns = xruns
+        self.window = window
+        self.lateness = lateness
+        self.retries = retries
+        self.on_failure = on_failure
+        self.restarts = 0
+        self.failures = 0
+
+    def init_log(self):
+        self.log = logging.getLogger('%s.%s' % (
+            __name__, self.__class__.__name__))
+
+    def check(self):
+        '''Return a description of the problem with the sound server,
+        or None if there is no problem.'''
+        now = time.time()
+
+        if not self.synth.server.getIsStarted():
+            return 'sound server is not running'
+
+        if now - self.synth.last_heartbeat > self.timeout:
+            return 'audio callback stalled for %.0f ms' % (
+                1000 * (now - self.synth.last_heartbeat))
+
+        recent = [(t, late) for t, late in self.synth.xruns
+                  if now - t < self.window]
+        self.synth.xruns[:] = recent
+        xruns = [t for t, late in recent if late > self.lateness]
+        if len(xruns) >= self.xruns:
+            return '%d xruns in %d seconds' % (len(xruns), self.window)
+
+    def recover(self, reason):
+        '''Restart the synth.  Returns True if the restart succeeded.'''
+        self.log.error('restarting sound server: %s', reason)
+        start = time.time()
+
+        # the watchdog must keep running no matter what went wrong, so
+        # that it can try again.
+        try:
+            self.synth.restart()
+        except Exception:
+            self.log.exception('failed to restart sound server')
+            return False
+
+        del self.synth.xruns[:]
+        self.restarts += 1
+        self.log.warn('sound server restarted in %.0f ms',
+                      1000 * (time.time() - start))
+        return True
+
+    def backoff(self):
+        '''Return how long to wait before the next restart attempt.'''
+        return min(self.interval * 2 ** self.failures, MAX_BACKOFF)
+
+    def run(self, stop):
+        '''Check the sound server every `interval` seconds until _stop_
+        is set, or until too many restarts have failed.  Intended to be
+        run with `Supervisor.start_worker`.'''
+        delay = self.interval
+        while not stop.wait(delay):
+            delay = self.interval
+            if not self.synth.running:
+                continue
+
+            reason = self.check()
+            if reason is None:
+                continue
+
+            if self.recover(reason):
+                self.failures = 0
+                continue
+
+            self.failures += 1
+            if self.failures >= self.retries:
+                self.log.error('giving up after %d failed restarts',
+                               self.failures)
+                if self.on_failure is not None:
+                    self.on_failure()
+                return
+
+            delay = self.backoff()
+            self.log.warn('retrying in %.1f seconds', delay)
@@ -0,0 +1,96 @@
+from __future__ import division
+
+import unittest
+
+import numpy
+import pyo
+
+from siggen.analysis import Analyzer
+
+SR = 44100
+
+
+class TestEstimateFreq(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = Analyzer('test', SR)
+        self.t = numpy.arange(self.analyzer.size) / SR
+
+    def estimate(self, samples):
+        self.analyzer.frame[:] = samples
+        rms = numpy.sqrt(numpy.mean(numpy.square(self.analyzer.frame)))
+        return self.analyzer.estimate_freq(rms)
+
+    def sine(self, freq, phase=0.3):
+        return numpy.sin(2 * numpy.pi * freq * self.t + phase)
+
+    def assertFreq(self, estimate, freq):
+        self.assertIsNotNone(estimate)
+        self.assertAlmostEqual(estimate, freq, delta=freq * 0.01)
+
+    def test_sine(self):
+        for freq in [60, 90, 110, 130, 150, 180, 220, 441, 1000, 1900]:
+            self.assertFreq(self.estimate(self.sine(freq)), freq)
+
+    def test_type(self):
+        self.assertIs(type(self.estimate(self.sine(220))), float)
+
+    def test_harmonics(self):
+        for freq in [60, 110, 150, 440, 1000]:
+            samples = sum(self.sine(freq * k) / k for k in range(1, 8))
+            self.assertFreq(self.estimate(samples), freq)
+
+    def test_weak_fundamental(self):
+        for freq in [60, 110, 440]:
+            samples = 0.3 * self.sine(freq) + self.sine(2 * freq)
+            self.assertFreq(self.estimate(samples), freq)
+
+    def test_dc_offset(self):
+        self.assertFreq(self.estimate(0.5 + self.sine(110)), 110)
+
+    def test_out_of_range(self):
+        self.assertIsNone(self.estimate(self.sine(30)))
+        self.assertIsNone(self.estimate(self.sine(2500)))
+
+    def test_quiet(self):
+        self.assertIsNone(self.estimate(0.001 * self.sine(440)))
+
+    def test_noise(self):
+        numpy.random.seed(1)
+        self.assertIsNone(self.estimate(numpy.random.randn(
+            self.analyzer.size)))
+
+
+class TestPublish(unittest.TestCase):
+    def setUp(self):
+        self.server = pyo.Server(audio='manual').boot()
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_follow(self):
+        analyzer = Analyzer('test', SR)
+        t = numpy.arange(analyzer.size) / SR
+        analyzer.frame[:] = numpy.sign(numpy.sin(2 * numpy.pi * 220 * t))
+
+        # PYO objects must be released before the server is shut down
+        sigs = [pyo.SigTo(0)]
+        followed = []
+
+        def follow(result):
+            sigs[0].setValue(result['freq'])
+            followed.append(result['freq'])
+
+        source = pyo.Sig(0)
+        analyzer.attach(source)
+        analyzer.subscribe(follow)
+        analyzer.publish({'freq': analyzer.estimate_freq(1)})
+
+        self.assertEqual(len(followed), 1)
+        self.assertAlmostEqual(followed[0], 220, delta=2.2)
+
+        # listeners are not called once the analyzer is detached
+        analyzer.detach()
+        analyzer.publish({'freq': 440.0})
+        self.assertEqual(len(followed), 1)
+        del sigs[:]
+        del source
@@ -0,0 +1,54 @@
+import unittest
+
+from siggen import tune
+
+
+def result(tsize, nharmonics, distortion, interpolation=0, cpu=0.001):
+    return {
+        'tsize': tsize,
+        'nharmonics': nharmonics,
+        'cpu': cpu,
+        'build': 0.0001 * nharmonics,
+        'memory': tsize * tune.SAMPLE_BYTES,
+        'distortion': distortion,
+        'interpolation': interpolation,
+    }
+
+
+def best(results):
+    r = tune.select_best(tune.pareto_front(results))
+    return r['tsize'], r['nharmonics']
+
+
+class TestSelectBest(unittest.TestCase):
+    def test_distortion(self):
+        # fewer harmonics are cheaper, but much more distorted
+        results = [result(1024, 10, 0.140),
+                   result(1024, 20, 0.124),
+                   result(1024, 30, 0.119),
+                   result(1024, 60, 0.112)]
+        self.assertEqual(best(results), (1024, 30))
+
+    def test_similar_distortion(self):
+        results = [result(1024, 10, 0.100),
+                   result(1024, 60, 0.099)]
+        self.assertEqual(best(results), (1024, 10))
+
+    def test_noise_floor(self):
+        # smaller tables are cheaper, but interpolate badly
+        results = [result(256, 30, 0.1, interpolation=4e-3),
+                   result(512, 30, 0.1, interpolation=1e-3),
+                   result(1024, 30, 0.1, interpolation=5e-5),
+                   result(2048, 30, 0.1, interpolation=1e-5)]
+        self.assertEqual(best(results), (1024, 30))
+
+    def test_noise_floor_unreachable(self):
+        results = [result(256, 30, 0.1, interpolation=4e-2),
+                   result(512, 30, 0.1, interpolation=1e-2)]
+        self.assertEqual(best(results), (512, 30))
+
+    def test_cpu_noise(self):
+        # small timing differences do not outweigh memory
+        results = [result(256, 30, 0.1, cpu=0.0013),
+                   result(8192, 30, 0.1, cpu=0.0012)]
+        self.assertEqual(best(results), (256, 30))